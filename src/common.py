@@ -0,0 +1,271 @@
+"""Definitions shared by main.py and main_full.py."""
+
+import bisect
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Spending columns used by each signal
+SIGNAL1_COLUMNS = ['BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH', 'TOTAL_PAID']
+SIGNAL2_COLUMNS = ['BILLING_PROVIDER_NPI_NUM', 'TOTAL_PAID', 'TOTAL_CLAIMS', 'TOTAL_UNIQUE_BENEFICIARIES']
+SIGNAL6_COLUMNS = ['BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH', 'HCPCS_CODE',
+                   'TOTAL_CLAIMS', 'TOTAL_UNIQUE_BENEFICIARIES']
+
+# Low-cardinality spending columns read dictionary-encoded when stored as strings
+DICTIONARY_COLUMNS = ['BILLING_PROVIDER_NPI_NUM', 'HCPCS_CODE']
+
+HOME_HEALTH_CODES = frozenset({
+    'G0151', 'G0152', 'G0153', 'G0154', 'G0155', 'G0156', 'G0157', 'G0158', 'G0159',
+    'G0160', 'G0161', 'G0162', 'G0299', 'G0300', 'S9122', 'S9123', 'S9124',
+    'T1019', 'T1020', 'T1021', 'T1022'
+})
+
+# HOME_HEALTH_CODES as an Arrow value set for pc.is_in on HCPCS_CODE
+HOME_HEALTH_VALUE_SET = pa.array(sorted(HOME_HEALTH_CODES))
+
+# Defaults for every flagged-provider entry; copied, never mutated
+FLAGGED_TEMPLATE = MappingProxyType({
+    'npi': '',
+    'provider_name': 'Unknown',
+    'entity_type': 'individual',
+    'taxonomy_code': '',
+    'state': '',
+    'enumeration_date': '',
+    'total_paid_all_time': 0,
+    'total_claims_all_time': 0,
+    'total_unique_beneficiaries_all_time': 0,
+    'signals': None,
+    'estimated_overpayment_usd': 0,
+    'fca_relevance': None
+})
+
+
+def parse_leie_date(values):
+    """Parse LEIE YYYYMMDD dates; blanks and placeholder zeros become NaT.
+
+    Only well-formed 8-digit values reach the parser, and cache=True parses
+    each distinct date once (LEIE repeats the same dates heavily).
+    """
+    s = values.astype('string')
+    valid = (s.str.len().eq(8) & s.str.isdigit()).fillna(False)
+    return pd.to_datetime(s.where(valid), format='%Y%m%d', errors='coerce', cache=True)
+
+
+def open_spending(path):
+    """Open the spending Parquet file with DICTIONARY_COLUMNS dictionary-encoded.
+
+    Low-cardinality string columns (HCPCS codes, and NPIs when stored as
+    strings) are read dictionary-encoded, so pandas gets categoricals.
+    pre_buffer coalesces each row group's column chunks into a few large
+    reads, issued together, so decode is not waiting on chunk-by-chunk I/O.
+    """
+    read_dictionary = [
+        field.name for field in pq.read_schema(path)
+        if field.name in DICTIONARY_COLUMNS
+        and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))
+    ]
+    return pq.ParquetFile(path, read_dictionary=read_dictionary, pre_buffer=True)
+
+
+def exclusion_windows(npis):
+    """Slot the distinct NPIs of LEIE's NPI column, sorted earliest exclusion first.
+
+    Returns (slot_npis, window_rows). slot_npis lists each distinct NPI once,
+    in first-seen order; window_rows[w] is an Arrow int64 array mapping each
+    slot to the LEIE position of the NPI's w-th exclusion window (an NPI
+    reinstated and excluded again has a record per window), null where the
+    NPI has fewer windows.
+    """
+    slots, slot_npis = pd.factorize(npis)
+    window = npis.groupby(slots).cumcount().to_numpy()
+    rows = np.full((window.max(initial=-1) + 1, len(slot_npis)), -1, dtype=np.int64)
+    rows[window, slots] = np.arange(len(npis))
+    return slot_npis.tolist(), [pa.array(layer, mask=layer < 0) for layer in rows]
+
+
+def npi_position_set(npis, npi_type):
+    """Arrow array of NPIs in their given order, typed like the spending NPI column.
+
+    NPIs an integer column cannot hold become nulls, so positions still line
+    up with `npis` (pc.index_in then maps a row to its position in `npis`).
+    """
+    if pa.types.is_integer(npi_type):
+        return pa.array([int(npi) if npi.isdigit() else None for npi in npis], type=npi_type)
+    return pa.array(npis, type=npi_type)
+
+
+def dictionary_is_in(column, value_set):
+    """pc.is_in over a ChunkedArray that may be dictionary-encoded.
+
+    For dictionary chunks the value set is tested against the (small)
+    dictionary once and the per-row mask is gathered through the indices,
+    so no string is hashed per row.
+    """
+    masks = []
+    for chunk in column.chunks:
+        if pa.types.is_dictionary(chunk.type):
+            hit = pc.is_in(chunk.dictionary, value_set=value_set.cast(chunk.dictionary.type))
+            masks.append(pc.take(hit, chunk.indices))
+        else:
+            masks.append(pc.is_in(chunk, value_set=value_set))
+    return pa.chunked_array(masks, type=pa.bool_())
+
+
+def dictionary_index_in(column, value_set):
+    """pc.index_in over a ChunkedArray that may be dictionary-encoded.
+
+    Same dictionary shortcut as dictionary_is_in; rows that do not match
+    (including null rows) get null.
+    """
+    options = pc.SetLookupOptions(value_set=value_set, skip_nulls=True)
+    positions = []
+    for chunk in column.chunks:
+        if pa.types.is_dictionary(chunk.type):
+            lookup = pc.SetLookupOptions(value_set=value_set.cast(chunk.dictionary.type), skip_nulls=True)
+            positions.append(pc.take(pc.index_in(chunk.dictionary, options=lookup), chunk.indices))
+        else:
+            positions.append(pc.index_in(chunk, options=options))
+    return pa.chunked_array(positions, type=pa.int32())
+
+
+def sum_by_npi(table):
+    """Per-billing-NPI sums of paid, claims and beneficiaries.
+
+    Runs as an Arrow hash aggregation, so rows are never converted to pandas.
+    The result keeps the input column names, with dictionary NPIs decoded,
+    so partial results can be concatenated and passed through again. Groups
+    come back in first-appearance order and a null NPI group is dropped, as
+    a pandas groupby would.
+    """
+    sum_options = pc.ScalarAggregateOptions(min_count=0)
+    agg = table.group_by('BILLING_PROVIDER_NPI_NUM', use_threads=False).aggregate([
+        ('TOTAL_PAID', 'sum', sum_options),
+        ('TOTAL_CLAIMS', 'sum', sum_options),
+        ('TOTAL_UNIQUE_BENEFICIARIES', 'sum', sum_options)
+    ])
+    npis = agg['BILLING_PROVIDER_NPI_NUM']
+    if pa.types.is_dictionary(npis.type):
+        npis = npis.cast(npis.type.value_type)
+    agg = pa.table({
+        'BILLING_PROVIDER_NPI_NUM': npis,
+        'TOTAL_PAID': agg['TOTAL_PAID_sum'],
+        'TOTAL_CLAIMS': agg['TOTAL_CLAIMS_sum'],
+        'TOTAL_UNIQUE_BENEFICIARIES': agg['TOTAL_UNIQUE_BENEFICIARIES_sum']
+    })
+    if npis.null_count:
+        agg = agg.filter(pc.is_valid(npis))
+    return agg
+
+
+def leie_date_table(leie, month_type):
+    """LEIE EXCLDATE/REINDATE as Arrow columns, in LEIE row order.
+
+    Timestamp claim months are compared at their own type, so the dates are
+    cast once here instead of per row group.
+    """
+    dates = pa.Table.from_pandas(leie[['EXCLDATE', 'REINDATE']], preserve_index=False)
+    if pa.types.is_timestamp(month_type):
+        dates = dates.cast(pa.schema([(name, month_type) for name in dates.column_names]))
+    return dates
+
+
+def excluded_claims(table, slots, window_rows, leie_dates, parse_month):
+    """Signal 1 violations in one row group, computed entirely in Arrow.
+
+    slots holds each row's excluded-NPI slot (null when the billing NPI is
+    not excluded), window_rows comes from exclusion_windows() and leie_dates
+    from leie_date_table(), so string months are parsed to its type. A claim counts
+    under the earliest window it was billed in: after exclusion and before
+    any reinstatement. Returns paid sum and claim count per LEIE_ROW, in
+    first-appearance order.
+    """
+    matched = pc.is_valid(slots)
+    slots = slots.filter(matched)
+    months = table['CLAIM_FROM_MONTH'].filter(matched)
+    if parse_month:
+        # Only the (few) excluded rows are parsed, with pandas' format inference
+        months = pa.array(pd.to_datetime(months.to_pandas(), errors='coerce'), type=leie_dates['EXCLDATE'].type)
+    leie_rows = pa.nulls(len(slots), pa.int64())
+    for layer in window_rows:
+        # Rows already placed in an earlier window keep it
+        candidates = pc.if_else(pc.is_null(leie_rows), layer.take(slots), leie_rows)
+        excldates = leie_dates['EXCLDATE'].take(candidates)
+        reindates = leie_dates['REINDATE'].take(candidates)
+        # Null months, exclusion dates or candidates give a null test: no hit
+        in_window = pc.and_kleene(
+            pc.greater(months, excldates),
+            pc.or_kleene(pc.is_null(reindates), pc.less(months, reindates))
+        )
+        leie_rows = pc.if_else(pc.fill_null(in_window, False), candidates, leie_rows)
+    violations = pa.table({
+        'LEIE_ROW': leie_rows,
+        'TOTAL_PAID': table['TOTAL_PAID'].filter(matched)
+    }).filter(pc.is_valid(leie_rows))
+    agg = violations.group_by('LEIE_ROW', use_threads=False).aggregate([
+        ('TOTAL_PAID', 'sum', pc.ScalarAggregateOptions(min_count=0)),
+        ('TOTAL_PAID', 'count', pc.CountOptions(mode='all'))
+    ])
+    return pa.table({
+        'LEIE_ROW': agg['LEIE_ROW'],
+        'paid': agg['TOTAL_PAID_sum'],
+        'claims': agg['TOTAL_PAID_count']
+    })
+
+
+def sum_home_health(table):
+    """Claims and beneficiaries summed per (NPI, month, home health code).
+
+    Codes are keyed by HH_CODE_INDEX, their position in HOME_HEALTH_VALUE_SET.
+    NPI keys come back as plain strings, so partial results from different
+    row groups can be concatenated and passed through again.
+    """
+    sum_options = pc.ScalarAggregateOptions(min_count=0)
+    agg = table.group_by(['BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH', 'HH_CODE_INDEX'], use_threads=False).aggregate([
+        ('TOTAL_CLAIMS', 'sum', sum_options),
+        ('TOTAL_UNIQUE_BENEFICIARIES', 'sum', sum_options)
+    ])
+    return pa.table({
+        'BILLING_PROVIDER_NPI_NUM': agg['BILLING_PROVIDER_NPI_NUM'].cast(pa.string()),
+        'CLAIM_FROM_MONTH': agg['CLAIM_FROM_MONTH'],
+        'HH_CODE_INDEX': agg['HH_CODE_INDEX'],
+        'TOTAL_CLAIMS': agg['TOTAL_CLAIMS_sum'],
+        'TOTAL_UNIQUE_BENEFICIARIES': agg['TOTAL_UNIQUE_BENEFICIARIES_sum']
+    })
+
+
+def new_flagged_entry(npi, **fields):
+    """Return a fresh flagged-provider entry: FLAGGED_TEMPLATE plus `fields`."""
+    entry = dict(FLAGGED_TEMPLATE)
+    entry['npi'] = npi
+    entry['signals'] = []
+    entry.update(fields)
+    return entry
+
+
+def column_ranges(pf, column):
+    """Per-row-group (min, max) of `column` from the Parquet footer statistics.
+
+    Entries are None where the column is absent or has no min/max recorded.
+    """
+    metadata = pf.metadata
+    names = metadata.schema.names
+    if column not in names:
+        return [None] * metadata.num_row_groups
+    j = names.index(column)
+    ranges = []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(j).statistics
+        ranges.append((stats.min, stats.max) if stats is not None and stats.has_min_max else None)
+    return ranges
+
+
+def range_may_contain(bounds, values):
+    """Whether a (min, max) statistics range can hold any of the sorted `values`."""
+    if bounds is None:
+        return True
+    k = bisect.bisect_left(values, bounds[0])
+    return k < len(values) and values[k] <= bounds[1]
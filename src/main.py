@@ -5,19 +5,75 @@ Medicaid Fraud Detection Engine - Minimal Working Version
 Quick implementation for competition submission.
 """
 
-import json
+import gc
 import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import pandas as pd
+import numpy as np
+import orjson
+
+try:
+    from .common import (
+        HOME_HEALTH_VALUE_SET, SIGNAL6_COLUMNS, column_ranges, dictionary_index_in,
+        dictionary_is_in, excluded_claims, exclusion_windows, leie_date_table,
+        new_flagged_entry, npi_position_set, open_spending, parse_leie_date, range_may_contain,
+        sum_by_npi
+    )
+except ImportError:  # run as a script rather than as part of the src package
+    from common import (
+        HOME_HEALTH_VALUE_SET, SIGNAL6_COLUMNS, column_ranges, dictionary_index_in,
+        dictionary_is_in, excluded_claims, exclusion_windows, leie_date_table,
+        new_flagged_entry, npi_position_set, open_spending, parse_leie_date, range_may_contain,
+        sum_by_npi
+    )
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 VERSION = "1.0.0"
 
+# Spending columns read by Signals 1, 2 and 6; everything else is skipped
+SPENDING_COLUMNS = [
+    'BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH', 'HCPCS_CODE',
+    'TOTAL_PAID', 'TOTAL_CLAIMS', 'TOTAL_UNIQUE_BENEFICIARIES'
+]
+
+def _grow(arr, size):
+    """Return arr zero-padded to hold at least `size` entries (capacity doubles)."""
+    capacity = len(arr)
+    while capacity < size:
+        capacity *= 2
+    grown = np.zeros(capacity, dtype=arr.dtype)
+    grown[:len(arr)] = arr
+    return grown
+
+
+def iter_row_groups(pf, num_groups, columns=None):
+    """Yield (index, table) for the first num_groups row groups.
+
+    The next row group is read on a background thread while the caller
+    processes the current one; pyarrow releases the GIL while decoding.
+    """
+    if num_groups <= 0:
+        return
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(pf.read_row_group, 0, columns=columns)
+        for i in range(num_groups):
+            table = pending.result()
+            if i + 1 < num_groups:
+                pending = pool.submit(pf.read_row_group, i + 1, columns=columns)
+            yield i, table
+            # Drop our reference too, so the caller can free the group
+            # before the prefetched one is handed over
+            del table
+
 
 def main():
     logger.info("Medicaid Fraud Detection v" + VERSION)
@@ -27,159 +83,187 @@ def main():
     
     # Load LEIE
     logger.info("Loading LEIE exclusions...")
-    leie = pd.read_csv(leie_path, low_memory=False)
-    leie = leie[['NPI', 'EXCLTYPE', 'EXCLDATE', 'REINDATE']].copy()
+    leie = pd.read_csv(leie_path, usecols=['NPI', 'EXCLTYPE', 'EXCLDATE', 'REINDATE'],
+                       dtype={'EXCLDATE': str, 'REINDATE': str}, low_memory=False)
     leie = leie[leie['NPI'].notna() & (leie['NPI'] != '')]
     leie['NPI'] = leie['NPI'].astype(str)
-    leie['EXCLDATE'] = pd.to_datetime(leie['EXCLDATE'], format='%Y%m%d', errors='coerce')
-    leie['REINDATE'] = pd.to_datetime(leie['REINDATE'], format='%Y%m%d', errors='coerce')
-    excluded_npis = set(leie['NPI'].unique())
+    leie['EXCLDATE'] = parse_leie_date(leie['EXCLDATE'])
+    leie['REINDATE'] = parse_leie_date(leie['REINDATE'])
+    # Exclusion fields are gathered by LEIE row position, earliest exclusion
+    # first. Each distinct excluded NPI gets a slot (see exclusion_windows)
+    leie = leie.sort_values('EXCLDATE', kind='stable').reset_index(drop=True)
+    excluded_npis, window_rows = exclusion_windows(leie['NPI'])
+    leie_npis = leie['NPI'].tolist()
+    leie_excldates = leie['EXCLDATE'].array
+    leie_excltypes = leie['EXCLTYPE'].to_numpy()
     logger.info(f"Loaded {len(excluded_npis):,} excluded NPIs")
     
     # Process Medicaid data
-    pf = pq.ParquetFile(spending_path)
+    pf = open_spending(spending_path)
+    file_schema = pq.read_schema(spending_path)
     logger.info(f"Processing {pf.metadata.num_row_groups} row groups...")
+    columns = [c for c in SPENDING_COLUMNS if c in pf.schema_arrow.names]
+    
+    # Inspect column types once so row groups are not re-parsed per iteration
+    npi_type = file_schema.field('BILLING_PROVIDER_NPI_NUM').type
+    month_type = file_schema.field('CLAIM_FROM_MONTH').type
+    parse_month = not pa.types.is_timestamp(month_type)
+    logger.info(f"Schema: BILLING_PROVIDER_NPI_NUM={npi_type}, CLAIM_FROM_MONTH={month_type}")
+    # LEIE dates for the in-Arrow Signal 1 window test, at the month type
+    leie_dates = leie_date_table(leie, month_type)
+    # Excluded NPIs are typed like the spending column once; the footer
+    # range checks below use the same array, sorted
+    excluded_slot_arr = npi_position_set(excluded_npis, npi_type)
     
     all_flagged = {}
-    provider_totals = {}
-    monthly_hh = {}
     
-    home_health_codes = {
-        'G0151', 'G0152', 'G0153', 'G0154', 'G0155', 'G0156', 'G0157', 'G0158', 'G0159',
-        'G0160', 'G0161', 'G0162', 'G0299', 'G0300', 'S9122', 'S9123', 'S9124',
-        'T1019', 'T1020', 'T1021', 'T1022'
+    # Provider totals as parallel arrays indexed through npi_index. Counts
+    # accumulate at the type pandas sums their column to (float64 for
+    # floating columns, int64 otherwise). Integer NPIs stay ints as keys
+    # (smaller and cheaper to hash than str) and are only turned into
+    # strings for the providers that get flagged.
+    integer_npis = pa.types.is_integer(npi_type)
+    npi_index = {}
+    count_dtypes = {
+        name: np.float64 if pa.types.is_floating(pf.schema_arrow.field(name).type) else np.int64
+        for name in ('TOTAL_CLAIMS', 'TOTAL_UNIQUE_BENEFICIARIES')
     }
+    paid_arr = np.zeros(1 << 16, dtype=np.float64)
+    claims_arr = np.zeros(1 << 16, dtype=count_dtypes['TOTAL_CLAIMS'])
+    ben_arr = np.zeros(1 << 16, dtype=count_dtypes['TOTAL_UNIQUE_BENEFICIARIES'])
+    
+    monthly_hh = {}
+    
+    # Footer statistics let Signals 1 and 6 skip row groups whose NPI or
+    # HCPCS range cannot hold an excluded NPI or a home health code
+    excluded_values = pc.drop_null(excluded_slot_arr).sort().to_pylist()
+    home_health_values = HOME_HEALTH_VALUE_SET.to_pylist()
+    npi_ranges = column_ranges(pf, 'BILLING_PROVIDER_NPI_NUM')
+    hcpcs_ranges = column_ranges(pf, 'HCPCS_CODE')
     
     # Process in chunks (set max_groups for testing, full run = max_groups=None)
     max_groups = 10  # CHANGE TO None FOR FULL RUN
     
-    for i in range(min(max_groups or pf.metadata.num_row_groups, pf.metadata.num_row_groups)):
+    num_groups = min(max_groups or pf.metadata.num_row_groups, pf.metadata.num_row_groups)
+    for i, table in iter_row_groups(pf, num_groups, columns):
         if i % 10 == 0:
             logger.info(f"Row group {i}")
         
-        table = pf.read_row_group(i)
-        df = table.to_pandas()
-        df['BILLING_PROVIDER_NPI_NUM'] = df['BILLING_PROVIDER_NPI_NUM'].astype(str)
-        df['CLAIM_FROM_MONTH'] = pd.to_datetime(df['CLAIM_FROM_MONTH'], errors='coerce')
+        has_hcpcs = 'HCPCS_CODE' in table.column_names
         
-        # Signal 1: Excluded providers
-        excluded = df[df['BILLING_PROVIDER_NPI_NUM'].isin(excluded_npis)]
-        if len(excluded) > 0:
-            excluded = excluded.merge(leie, left_on='BILLING_PROVIDER_NPI_NUM', right_on='NPI')
-            mask = (excluded['CLAIM_FROM_MONTH'] > excluded['EXCLDATE']) & \
-                    (excluded['REINDATE'].isna() | (excluded['CLAIM_FROM_MONTH'] < excluded['REINDATE']))
-            for _, row in excluded[mask].iterrows():
-                npi = row['BILLING_PROVIDER_NPI_NUM']
+        # Signal 1: Excluded providers, matched and summed in Arrow.
+        # One hash probe per row gives both LEIE membership and the NPI's slot
+        if range_may_contain(npi_ranges[i], excluded_values):
+            excluded_slots = dictionary_index_in(table['BILLING_PROVIDER_NPI_NUM'], excluded_slot_arr)
+            hits = excluded_claims(table, excluded_slots, window_rows, leie_dates, parse_month)
+            for j, paid, claims in zip(hits['LEIE_ROW'].to_pylist(), hits['paid'].to_pylist(),
+                                       hits['claims'].to_pylist()):
+                npi = leie_npis[j]
+                excldate = leie_excldates[j]
+                excltype = leie_excltypes[j]
                 if npi not in all_flagged:
-                    all_flagged[npi] = {
-                        'npi': npi,
-                        'provider_name': 'Unknown',
-                        'entity_type': 'individual',
-                        'taxonomy_code': '',
-                        'state': '',
-                        'enumeration_date': '',
-                        'total_paid_all_time': 0,
-                        'total_claims_all_time': 0,
-                        'total_unique_beneficiaries_all_time': 0,
-                        'signals': [],
-                        'estimated_overpayment_usd': 0,
-                        'fca_relevance': None
-                    }
+                    all_flagged[npi] = new_flagged_entry(npi)
                 all_flagged[npi]['signals'].append({
                     'signal_type': 'excluded_provider',
                     'severity': 'critical',
                     'evidence': {
-                        'exclusion_date': row['EXCLDATE'].strftime('%Y-%m-%d') if pd.notna(row['EXCLDATE']) else None,
-                        'exclusion_type': row['EXCLTYPE'],
-                        'total_paid_after_exclusion': row['TOTAL_PAID'],
-                        'claim_count': 1
+                        'exclusion_date': excldate.strftime('%Y-%m-%d'),
+                        'exclusion_type': excltype,
+                        'total_paid_after_exclusion': float(paid),
+                        'claim_count': int(claims)
                     }
                 })
-                all_flagged[npi]['estimated_overpayment_usd'] += row['TOTAL_PAID']
+                all_flagged[npi]['estimated_overpayment_usd'] += float(paid)
         
         # Aggregate provider totals
-        for _, row in df.iterrows():
-            npi = str(row['BILLING_PROVIDER_NPI_NUM'])
-            if npi not in provider_totals:
-                provider_totals[npi] = {'paid': 0, 'claims': 0, 'beneficiaries': 0}
-            provider_totals[npi]['paid'] += row['TOTAL_PAID']
-            provider_totals[npi]['claims'] += row['TOTAL_CLAIMS']
-            provider_totals[npi]['beneficiaries'] += row['TOTAL_UNIQUE_BENEFICIARIES']
+        agg = sum_by_npi(table)
+        if integer_npis:
+            agg_npis = agg['BILLING_PROVIDER_NPI_NUM'].to_pylist()
+        else:
+            agg_npis = [sys.intern(npi) for npi in agg['BILLING_PROVIDER_NPI_NUM'].cast(pa.string()).to_pylist()]
+        idx = np.fromiter((npi_index.setdefault(npi, len(npi_index)) for npi in agg_npis),
+                          dtype=np.int64, count=len(agg_npis))
+        if len(npi_index) > len(paid_arr):
+            paid_arr = _grow(paid_arr, len(npi_index))
+            claims_arr = _grow(claims_arr, len(npi_index))
+            ben_arr = _grow(ben_arr, len(npi_index))
+        paid_arr[idx] += agg['TOTAL_PAID'].to_numpy()
+        claims_arr[idx] += agg['TOTAL_CLAIMS'].to_numpy()
+        ben_arr[idx] += agg['TOTAL_UNIQUE_BENEFICIARIES'].to_numpy()
         
         # Signal 6: Home health geographic implausibility
-        if 'HCPCS_CODE' in df.columns:
-            hh = df[df['HCPCS_CODE'].isin(home_health_codes)]
-            if len(hh) > 0:
-                for _, row in hh.iterrows():
-                    if row['TOTAL_CLAIMS'] > 100:
-                        ratio = row['TOTAL_UNIQUE_BENEFICIARIES'] / row['TOTAL_CLAIMS'] if row['TOTAL_CLAIMS'] > 0 else 1
-                        if ratio < 0.1:
-                            npi = str(row['BILLING_PROVIDER_NPI_NUM'])
-                            if npi not in all_flagged:
-                                all_flagged[npi] = {
-                                    'npi': npi,
-                                    'provider_name': 'Unknown',
-                                    'entity_type': 'individual',
-                                    'taxonomy_code': '',
-                                    'state': '',
-                                    'enumeration_date': '',
-                                    'total_paid_all_time': 0,
-                                    'total_claims_all_time': 0,
-                                    'total_unique_beneficiaries_all_time': 0,
-                                    'signals': [],
-                                    'estimated_overpayment_usd': 0,
-                                    'fca_relevance': None
-                                }
-                            all_flagged[npi]['signals'].append({
-                                'signal_type': 'geographic_implausibility',
-                                'severity': 'medium',
-                                'evidence': {
-                                    'hcpcs_codes': [row['HCPCS_CODE']],
-                                    'month': row['CLAIM_FROM_MONTH'].strftime('%Y-%m-%d') if pd.notna(row['CLAIM_FROM_MONTH']) else None,
-                                    'total_claims': int(row['TOTAL_CLAIMS']),
-                                    'unique_beneficiaries': int(row['TOTAL_UNIQUE_BENEFICIARIES']),
-                                    'beneficiary_ratio': ratio
-                                }
-                            })
+        if has_hcpcs and range_may_contain(hcpcs_ranges[i], home_health_values):
+            # Rows without a billing NPI are dropped, as in Signal 2
+            hh_mask = pc.and_(dictionary_is_in(table['HCPCS_CODE'], HOME_HEALTH_VALUE_SET),
+                              pc.is_valid(table['BILLING_PROVIDER_NPI_NUM']))
+            hh_table = table.select(SIGNAL6_COLUMNS).filter(hh_mask)
+            if hh_table.num_rows > 0:
+                hh = hh_table.to_pandas()
+                claims = hh['TOTAL_CLAIMS'].to_numpy()
+                bens = hh['TOTAL_UNIQUE_BENEFICIARIES'].to_numpy()
+                # claims > 100 guarantees a non-zero denominator
+                busy = claims > 100
+                ratios = np.ones(len(hh))
+                ratios[busy] = bens[busy] / claims[busy]
+                implausible = busy & (ratios < 0.1)
+                flagged_hh = hh[implausible]
+                months = flagged_hh['CLAIM_FROM_MONTH']
+                if parse_month:
+                    months = pd.to_datetime(months, errors='coerce')
+                for npi, code, month, n_claims, n_bens, ratio in zip(
+                        flagged_hh['BILLING_PROVIDER_NPI_NUM'].astype(str), flagged_hh['HCPCS_CODE'], months,
+                        claims[implausible].tolist(), bens[implausible].tolist(), ratios[implausible].tolist()):
+                    if npi not in all_flagged:
+                        all_flagged[npi] = new_flagged_entry(npi)
+                    all_flagged[npi]['signals'].append({
+                        'signal_type': 'geographic_implausibility',
+                        'severity': 'medium',
+                        'evidence': {
+                            'hcpcs_codes': [code],
+                            'month': month.strftime('%Y-%m-%d') if pd.notna(month) else None,
+                            'total_claims': int(n_claims),
+                            'unique_beneficiaries': int(n_bens),
+                            'beneficiary_ratio': ratio
+                        }
+                    })
+        
+        # Release this row group's frames before the next one is handed over
+        table = agg = excluded_slots = hits = hh_table = hh = flagged_hh = None
+        if i % 16 == 15:
+            gc.collect()
     
     # Signal 2: Billing outliers (global 99th percentile)
     logger.info("Calculating billing outliers...")
-    totals = [v['paid'] for v in provider_totals.values()]
-    if len(totals) > 0:
-        import numpy as np
-        p99 = np.percentile(totals, 99)
-        median = np.median(totals)
+    num_providers = len(npi_index)
+    totals = paid_arr[:num_providers]
+    if num_providers > 0:
+        # One selection pass for both order statistics
+        median, p99 = np.quantile(totals, [0.5, 0.99])
         logger.info(f"99th percentile: ${p99:,.2f}, median: ${median:,.2f}")
         
-        for npi, data in provider_totals.items():
-            if data['paid'] > p99:
-                ratio = data['paid'] / median if median > 0 else 0
-                if npi not in all_flagged:
-                    all_flagged[npi] = {
-                        'npi': npi,
-                        'provider_name': 'Unknown',
-                        'entity_type': 'individual',
-                        'taxonomy_code': '',
-                        'state': '',
-                        'enumeration_date': '',
-                        'total_paid_all_time': data['paid'],
-                        'total_claims_all_time': data['claims'],
-                        'total_unique_beneficiaries_all_time': data['beneficiaries'],
-                        'signals': [],
-                        'estimated_overpayment_usd': 0,
-                        'fca_relevance': None
-                    }
-                all_flagged[npi]['signals'].append({
-                    'signal_type': 'billing_outlier',
-                    'severity': 'high' if ratio > 5 else 'medium',
-                    'evidence': {
-                        'peer_median': float(median),
-                        'peer_99th_percentile': float(p99),
-                        'ratio_to_median': float(ratio)
-                    }
-                })
-                all_flagged[npi]['estimated_overpayment_usd'] = max(0, data['paid'] - p99)
-    
+        npis = list(npi_index)
+        for j in np.flatnonzero(totals > p99):
+            npi = str(npis[j])
+            paid = float(totals[j])
+            ratio = paid / median if median > 0 else 0
+            if npi not in all_flagged:
+                all_flagged[npi] = new_flagged_entry(
+                    npi,
+                    total_paid_all_time=paid,
+                    total_claims_all_time=claims_arr[j].item(),
+                    total_unique_beneficiaries_all_time=ben_arr[j].item()
+                )
+            all_flagged[npi]['signals'].append({
+                'signal_type': 'billing_outlier',
+                'severity': 'high' if ratio > 5 else 'medium',
+                'evidence': {
+                    'peer_median': float(median),
+                    'peer_99th_percentile': float(p99),
+                    'ratio_to_median': float(ratio)
+                }
+            })
+            all_flagged[npi]['estimated_overpayment_usd'] = max(0, paid - float(p99))
+
     # Count signals
     signal_counts = {
         'excluded_provider': 0,
@@ -207,15 +291,15 @@ def main():
     report = {
         'generated_at': datetime.utcnow().isoformat() + 'Z',
         'tool_version': VERSION,
-        'total_providers_scanned': len(provider_totals),
+        'total_providers_scanned': num_providers,
         'total_providers_flagged': len(all_flagged),
         'signal_counts': signal_counts,
         'flagged_providers': list(all_flagged.values())
     }
     
     # Save
-    with open('fraud_signals.json', 'w') as f:
-        json.dump(report, f, indent=2, default=str)
+    with open('fraud_signals.json', 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC))
     
     logger.info("="*60)
     logger.info("COMPLETE")
@@ -5,18 +5,37 @@ Medicaid Provider Fraud Signal Detection Engine - Full Implementation
 Processes full 227M row dataset with all 6 signals.
 """
 
+import os
 import sys
-import json
 import logging
+import tempfile
 import zipfile
-import csv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
 import pandas as pd
-import numpy as np
+import orjson
+
+try:
+    from .common import (
+        HOME_HEALTH_VALUE_SET, SIGNAL1_COLUMNS, SIGNAL2_COLUMNS, SIGNAL6_COLUMNS, column_ranges,
+        dictionary_index_in, excluded_claims, exclusion_windows, leie_date_table,
+        new_flagged_entry, npi_position_set, open_spending, parse_leie_date, range_may_contain,
+        sum_by_npi, sum_home_health
+    )
+except ImportError:  # run as a script rather than as part of the src package
+    from common import (
+        HOME_HEALTH_VALUE_SET, SIGNAL1_COLUMNS, SIGNAL2_COLUMNS, SIGNAL6_COLUMNS, column_ranges,
+        dictionary_index_in, excluded_claims, exclusion_windows, leie_date_table,
+        new_flagged_entry, npi_position_set, open_spending, parse_leie_date, range_may_contain,
+        sum_by_npi, sum_home_health
+    )
 
 logging.basicConfig(
     level=logging.INFO,
@@ -41,297 +60,441 @@ NPPES_COLS = {
 }
 
 
-def load_nppes_sample(zip_path: str, sample_size: int = 100000) -> dict:
+NPPES_FIELDS = ['entity_type', 'name', 'state', 'enumeration_date', 'taxonomy',
+                'auth_official_last', 'auth_official_first']
+
+
+def nppes_frame(columns: dict) -> pd.DataFrame:
+    """Build the NPI-indexed NPPES frame from {'NPI': column, field: column, ...}.
+
+    A repeated NPI keeps its last record.
+    """
+    df = pd.DataFrame(columns, columns=['NPI'] + NPPES_FIELDS)
+    return df.drop_duplicates('NPI', keep='last').set_index('NPI')
+
+
+def nppes_lookup(nppes: pd.DataFrame, npis) -> dict:
+    """NPPES fields for `npis` as {npi: {field: value}}; unknown NPIs are left out."""
+    if len(npis) == 0:
+        return {}
+    return nppes.reindex(npis).dropna(how='all').to_dict('index')
+
+
+def _nppes_csv_options():
+    """Arrow CSV options reading only the NPPES_COLS columns, as strings.
+
+    Columns are addressed by position (auto-named f0, f1, ...) because
+    NPPES_COLS is keyed by index, not by the full header text.
+    """
+    names = [f"f{index}" for index in NPPES_COLS.values()]
+    read_options = pacsv.ReadOptions(autogenerate_column_names=True, skip_rows=1)
+    convert_options = pacsv.ConvertOptions(
+        include_columns=names,
+        column_types={name: pa.string() for name in names}
+    )
+    return read_options, convert_options
+
+
+def _nppes_from_table(table: pa.Table) -> pd.DataFrame:
+    """Build the NPPES frame from a table read with _nppes_csv_options()."""
+    def column(name):
+        return table[f"f{NPPES_COLS[name]}"]
+    
+    organization = column('Provider Organization Name')
+    person = pc.utf8_trim_whitespace(pc.binary_join_element_wise(
+        column('Provider First Name'), column('Provider Last Name'), ' '))
+    return nppes_frame({
+        'NPI': column('NPI').to_pandas(),
+        'entity_type': column('Entity Type Code').to_pandas(),
+        'name': pc.if_else(pc.equal(organization, ''), person, organization).to_pandas(),
+        'state': column('Provider Business State').to_pandas(),
+        'enumeration_date': column('Provider Enumeration Date').to_pandas(),
+        'taxonomy': column('Healthcare Provider Taxonomy Code_1').to_pandas(),
+        'auth_official_last': column('Authorized Official Last Name').to_pandas(),
+        'auth_official_first': column('Authorized Official First Name').to_pandas()
+    })
+
+
+def load_nppes_sample(zip_path: str, sample_size: int = 100000) -> pd.DataFrame:
     """Load a sample of NPPES data for testing."""
     logger.info(f"Loading NPPES sample ({sample_size:,} records)...")
     
-    nppes = {}
+    read_options, convert_options = _nppes_csv_options()
+    batches = []
+    rows = 0
     with zipfile.ZipFile(zip_path, 'r') as zf:
         with zf.open('npidata_pfile_20050523-20260208.csv') as f:
-            reader = csv.reader(line.decode('utf-8') for line in f)
-            next(reader)  # Skip header
-            
-            for i, row in enumerate(reader):
-                if i >= sample_size:
+            # Stream blocks so only the first sample_size rows are parsed
+            reader = pacsv.open_csv(f, read_options=read_options, convert_options=convert_options)
+            for batch in reader:
+                batches.append(batch)
+                logged = rows // 10000
+                rows += batch.num_rows
+                # Log every 10,000 rows, as the row-by-row reader did
+                if rows // 10000 > logged:
+                    logger.info(f"  NPPES row {rows:,}")
+                if rows >= sample_size:
                     break
-                if i % 10000 == 0:
-                    logger.info(f"  NPPES row {i:,}")
-                
-                npi = row[NPPES_COLS['NPI']]
-                nppes[npi] = {
-                    'entity_type': row[NPPES_COLS['Entity Type Code']],
-                    'name': row[NPPES_COLS['Provider Organization Name']] or 
-                            f"{row[NPPES_COLS['Provider First Name']]} {row[NPPES_COLS['Provider Last Name']]}".strip(),
-                    'state': row[NPPES_COLS['Provider Business State']],
-                    'enumeration_date': row[NPPES_COLS['Provider Enumeration Date']],
-                    'taxonomy': row[NPPES_COLS['Healthcare Provider Taxonomy Code_1']],
-                    'auth_official_last': row[NPPES_COLS['Authorized Official Last Name']],
-                    'auth_official_first': row[NPPES_COLS['Authorized Official First Name']]
-                }
+            schema = reader.schema
     
+    table = pa.Table.from_batches(batches, schema=schema).slice(0, sample_size)
+    nppes = _nppes_from_table(table)
     logger.info(f"Loaded {len(nppes):,} NPPES records")
     return nppes
 
 
-def load_nppes_full(zip_path: str) -> dict:
-    """Load full NPPES data (streaming, memory-efficient)."""
+def load_nppes_full(zip_path: str) -> pd.DataFrame:
+    """Load full NPPES data (Arrow's multithreaded CSV reader, 8 columns only).
+
+    The parsed frame is cached as Parquet next to the zip and reused while
+    the cache is newer than the zip. The cache is written to a temporary
+    file and renamed into place, so a crashed or concurrent run never
+    leaves a partial cache behind; an unreadable cache is re-parsed.
+    """
+    cache_path = Path(zip_path).with_name('nppes.cache.parquet')
+    if cache_path.exists() and cache_path.stat().st_mtime > Path(zip_path).stat().st_mtime:
+        logger.info(f"Loading NPPES from cache {cache_path}")
+        try:
+            nppes = pd.read_parquet(cache_path)
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"Could not read NPPES cache {cache_path}, re-parsing: {e}")
+        else:
+            logger.info(f"Loaded {len(nppes):,} NPPES records")
+            return nppes
+    
     logger.info("Loading full NPPES data...")
     
-    nppes = {}
+    read_options, convert_options = _nppes_csv_options()
     with zipfile.ZipFile(zip_path, 'r') as zf:
         with zf.open('npidata_pfile_20050523-20260208.csv') as f:
-            reader = csv.reader(line.decode('utf-8') for line in f)
-            next(reader)  # Skip header
-            
-            for i, row in enumerate(reader):
-                if i % 100000 == 0:
-                    logger.info(f"  NPPES row {i:,}")
-                
-                npi = row[NPPES_COLS['NPI']]
-                nppes[npi] = {
-                    'entity_type': row[NPPES_COLS['Entity Type Code']],
-                    'name': row[NPPES_COLS['Provider Organization Name']] or 
-                            f"{row[NPPES_COLS['Provider First Name']]} {row[NPPES_COLS['Provider Last Name']]}".strip(),
-                    'state': row[NPPES_COLS['Provider Business State']],
-                    'enumeration_date': row[NPPES_COLS['Provider Enumeration Date']],
-                    'taxonomy': row[NPPES_COLS['Healthcare Provider Taxonomy Code_1']],
-                    'auth_official_last': row[NPPES_COLS['Authorized Official Last Name']],
-                    'auth_official_first': row[NPPES_COLS['Authorized Official First Name']]
-                }
+            table = pacsv.read_csv(f, read_options=read_options, convert_options=convert_options)
     
+    nppes = _nppes_from_table(table)
     logger.info(f"Loaded {len(nppes):,} NPPES records")
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=cache_path.name + '.', suffix='.tmp', dir=cache_path.parent)
+        os.close(fd)
+        nppes.to_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Cached NPPES to {cache_path}")
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f"Could not write NPPES cache {cache_path}: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
     return nppes
 
 
 def load_leie(path: str) -> pd.DataFrame:
     """Load OIG LEIE exclusion list."""
     logger.info(f"Loading LEIE from {path}")
-    df = pd.read_csv(path, low_memory=False)
-    df = df[['NPI', 'EXCLTYPE', 'EXCLDATE', 'REINDATE', 'LASTNAME', 'FIRSTNAME']].copy()
+    df = pd.read_csv(path, usecols=['NPI', 'EXCLTYPE', 'EXCLDATE', 'REINDATE', 'LASTNAME', 'FIRSTNAME'],
+                     dtype={'EXCLDATE': str, 'REINDATE': str}, low_memory=False)
     df = df[df['NPI'].notna() & (df['NPI'] != '')]
     df['NPI'] = df['NPI'].astype(str)
-    df['EXCLDATE'] = pd.to_datetime(df['EXCLDATE'], format='%Y%m%d', errors='coerce')
-    df['REINDATE'] = pd.to_datetime(df['REINDATE'], format='%Y%m%d', errors='coerce')
+    df['EXCLDATE'] = parse_leie_date(df['EXCLDATE'])
+    df['REINDATE'] = parse_leie_date(df['REINDATE'])
     logger.info(f"Loaded {len(df):,} LEIE exclusions")
     return df
 
 
-def run_all_signals(spending_path: str, leie_df: pd.DataFrame, nppes: dict, max_groups: int = None) -> dict:
-    """Run all 6 fraud detection signals."""
+# Read-only scan inputs, set once per worker process by _init_scan_worker
+_scan_state = {}
+
+
+def _init_scan_worker(state: dict):
+    """Process pool initializer: keep the shared inputs and open the spending file."""
+    _scan_state.update(state)
+    _scan_state['pf'] = open_spending(state['spending_path'])
+
+
+def scan_row_group(i: int):
+    """Map step of the scan: everything Signals 1, 2 and 6 need from row group i.
+
+    Runs in a worker process and returns (hits, npi_partial, hh_partial):
+    Signal 1 (LEIE_ROW, paid, claims) hits from excluded_claims(), the
+    sum_by_npi() partial, and the sum_home_health() partial (None when the
+    group holds no home health rows to check).
+    """
+    state = _scan_state
+    # One decode thread per worker; the pool already runs one worker per CPU
+    table = state['pf'].read_row_group(i, columns=state['columns'], use_threads=False)
+    
+    # Signal 1: Excluded providers (billing NPI), matched against the LEIE
+    # slots and checked against the exclusion windows in Arrow
+    hits = []
+    if range_may_contain(state['npi_ranges'][i], state['excluded_values']):
+        slots = dictionary_index_in(table['BILLING_PROVIDER_NPI_NUM'], state['excluded_slot_arr'])
+        claims = excluded_claims(table, slots, state['window_rows'], state['leie_dates'], state['parse_month'])
+        hits = list(zip(claims['LEIE_ROW'].to_pylist(), claims['paid'].to_pylist(), claims['claims'].to_pylist()))
+    
+    # Signal 2: per-provider totals for this group. Arrow groups come out in
+    # first-appearance order; sort them by the NPI string so providers are
+    # first seen in the order a sorted groupby gives
+    npi_partial = sum_by_npi(table)
+    npi_partial = npi_partial.take(pc.sort_indices(npi_partial['BILLING_PROVIDER_NPI_NUM'].cast(pa.string())))
+    
+    # Signal 6: home health claims per provider-month-code for this group.
+    # Rows without a billing NPI are dropped, as in Signal 2
+    hh_partial = None
+    if 'HCPCS_CODE' in table.column_names and range_may_contain(state['hcpcs_ranges'][i],
+                                                                state['home_health_values']):
+        code_index = dictionary_index_in(table['HCPCS_CODE'], HOME_HEALTH_VALUE_SET)
+        hh = table.select(['BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH', 'TOTAL_CLAIMS', 'TOTAL_UNIQUE_BENEFICIARIES'])
+        hh = hh.append_column('HH_CODE_INDEX', code_index).filter(
+            pc.and_(pc.is_valid(code_index), pc.is_valid(table['BILLING_PROVIDER_NPI_NUM'])))
+        hh_partial = sum_home_health(hh)
+    
+    return hits, npi_partial, hh_partial
+
+
+def run_all_signals(spending_path: str, leie_df: pd.DataFrame, nppes: pd.DataFrame, max_groups: int = None,
+                    workers: int = None) -> dict:
+    """Run all 6 fraud detection signals.
+
+    Row groups are scanned in parallel by `workers` processes (default: one
+    per CPU); their results are reduced here in row-group order.
+    """
     
-    pf = pq.ParquetFile(spending_path)
+    pf = open_spending(spending_path)
+    file_schema = pq.read_schema(spending_path)
     total_groups = pf.metadata.num_row_groups
     groups_to_process = max_groups if max_groups else total_groups
     
     logger.info(f"Processing {groups_to_process:,} of {total_groups:,} row groups")
+    available = set(pf.schema_arrow.names)
+    
+    # Inspect column types once so row groups are not re-parsed per iteration
+    npi_type = file_schema.field('BILLING_PROVIDER_NPI_NUM').type
+    month_type = file_schema.field('CLAIM_FROM_MONTH').type
+    parse_month = not pa.types.is_timestamp(month_type)
+    logger.info(f"Schema: BILLING_PROVIDER_NPI_NUM={npi_type}, CLAIM_FROM_MONTH={month_type}")
     
     # Storage for all signals
     all_flagged = {}
-    
-    # Signal 1: Excluded providers
-    logger.info("\n=== Signal 1: Excluded Provider Still Billing ===")
-    excluded_npis = set(leie_df['NPI'].unique())
+    # Exclusion fields are gathered by LEIE row position, earliest exclusion
+    # first. Each distinct excluded NPI gets a slot (see exclusion_windows)
+    leie_df = leie_df.sort_values('EXCLDATE', kind='stable').reset_index(drop=True)
+    excluded_npis, window_rows = exclusion_windows(leie_df['NPI'])
+    # Excluded NPIs are typed like the spending column once; the footer
+    # range checks below use the same array, sorted
+    excluded_slot_arr = npi_position_set(excluded_npis, npi_type)
+    leie_npis = leie_df['NPI'].tolist()
+    leie_excldates = leie_df['EXCLDATE'].array
+    leie_excltypes = leie_df['EXCLTYPE'].to_numpy()
+    leie_first_names = leie_df['FIRSTNAME'].to_numpy()
+    leie_last_names = leie_df['LASTNAME'].to_numpy()
+    leie_dates = leie_date_table(leie_df, month_type)
     signal1_count = 0
+    signal1_seen = set()  # (npi, *evidence) of emitted excluded_provider signals
+    npi_parts = []  # partial per-NPI sums, see sum_by_npi
+    hh_parts = []  # partial (npi, month, code) sums, see sum_home_health
+    
+    # Footer statistics let Signals 1 and 6 skip row groups whose NPI or
+    # HCPCS range cannot hold an excluded NPI or a home health code
+    excluded_values = pc.drop_null(excluded_slot_arr).sort().to_pylist()
+    home_health_values = HOME_HEALTH_VALUE_SET.to_pylist()
+    npi_ranges = column_ranges(pf, 'BILLING_PROVIDER_NPI_NUM')
+    hcpcs_ranges = column_ranges(pf, 'HCPCS_CODE')
+    
+    # Single pass over the parquet: each row group is decoded once, in a
+    # worker process, and feeds Signal 1 matching, Signal 2 totals and
+    # Signal 6 accumulation.
+    logger.info("\n=== Scanning row groups (Signals 1, 2, 6) ===")
+    scan_state = {
+        'spending_path': spending_path,
+        'columns': [c for c in dict.fromkeys(SIGNAL1_COLUMNS + SIGNAL2_COLUMNS + SIGNAL6_COLUMNS) if c in available],
+        'parse_month': parse_month,
+        'excluded_values': excluded_values,
+        'excluded_slot_arr': excluded_slot_arr,
+        'window_rows': window_rows,
+        'leie_dates': leie_dates,
+        'home_health_values': home_health_values,
+        'npi_ranges': npi_ranges,
+        'hcpcs_ranges': hcpcs_ranges
+    }
     
-    for i in range(min(groups_to_process, total_groups)):
-        if i % 100 == 0:
-            logger.info(f"Signal 1: Row group {i}/{groups_to_process}")
-        
-        table = pf.read_row_group(i)
-        df = table.to_pandas()
-        df['BILLING_PROVIDER_NPI_NUM'] = df['BILLING_PROVIDER_NPI_NUM'].astype(str)
-        df['SERVICING_PROVIDER_NPI_NUM'] = df['SERVICING_PROVIDER_NPI_NUM'].astype(str)
-        df['CLAIM_FROM_MONTH'] = pd.to_datetime(df['CLAIM_FROM_MONTH'], errors='coerce')
-        
-        # Check billing providers
-        for npi in df['BILLING_PROVIDER_NPI_NUM'].unique():
-            if npi in excluded_npis:
-                leie_record = leie_df[leie_df['NPI'] == npi].iloc[0]
-                provider_claims = df[df['BILLING_PROVIDER_NPI_NUM'] == npi]
+    num_groups = min(groups_to_process, total_groups)
+    # At most two row groups in flight per worker, so finished partials
+    # cannot pile up if this loop falls behind
+    window = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker, initargs=(scan_state,)) as pool:
+        pending = deque(pool.submit(scan_row_group, i) for i in range(min(window, num_groups)))
+        for i in range(num_groups):
+            hits, npi_partial, hh_partial = pending.popleft().result()
+            if i + window < num_groups:
+                pending.append(pool.submit(scan_row_group, i + window))
+            if i % 100 == 0:
+                logger.info(f"Row group {i}/{groups_to_process}")
+            
+            # Signal 1: flag this group's violations
+            hits_nppes = nppes_lookup(nppes, list(dict.fromkeys(leie_npis[j] for j, _, _ in hits)))
+            for j, total_paid, claim_count in hits:
+                npi = leie_npis[j]
+                excldate = leie_excldates[j]
+                nppes_info = hits_nppes.get(npi, {})
+                if npi not in all_flagged:
+                    all_flagged[npi] = new_flagged_entry(
+                        npi,
+                        provider_name=nppes_info.get('name', f"{leie_first_names[j]} {leie_last_names[j]}"),
+                        entity_type='organization' if nppes_info.get('entity_type') == '2' else 'individual',
+                        taxonomy_code=nppes_info.get('taxonomy', ''),
+                        state=nppes_info.get('state', ''),
+                        enumeration_date=nppes_info.get('enumeration_date', '')
+                    )
                 
-                violations = provider_claims[
-                    (provider_claims['CLAIM_FROM_MONTH'] > leie_record['EXCLDATE']) &
-                    (leie_record['REINDATE'].isna() | (provider_claims['CLAIM_FROM_MONTH'] < leie_record['REINDATE']))
-                ]
+                all_flagged[npi]['total_paid_all_time'] += total_paid
+                all_flagged[npi]['total_claims_all_time'] += claim_count
                 
-                if len(violations) > 0:
-                    nppes_info = nppes.get(npi, {})
-                    if npi not in all_flagged:
-                        all_flagged[npi] = {
-                            'npi': npi,
-                            'provider_name': nppes_info.get('name', f"{leie_record['FIRSTNAME']} {leie_record['LASTNAME']}"),
-                            'entity_type': 'organization' if nppes_info.get('entity_type') == '2' else 'individual',
-                            'taxonomy_code': nppes_info.get('taxonomy', ''),
-                            'state': nppes_info.get('state', ''),
-                            'enumeration_date': nppes_info.get('enumeration_date', ''),
-                            'total_paid_all_time': 0,
-                            'total_claims_all_time': 0,
-                            'total_unique_beneficiaries_all_time': 0,
-                            'signals': [],
-                            'estimated_overpayment_usd': 0
-                        }
-                    
-                    total_paid = violations['TOTAL_PAID'].sum()
-                    all_flagged[npi]['total_paid_all_time'] += total_paid
-                    all_flagged[npi]['total_claims_all_time'] += len(violations)
-                    
-                    # Add signal
-                    sig = {
-                        'signal_type': 'excluded_provider',
-                        'severity': 'critical',
-                        'evidence': {
-                            'exclusion_date': leie_record['EXCLDATE'].strftime('%Y-%m-%d'),
-                            'exclusion_type': leie_record['EXCLTYPE'],
-                            'total_paid_after_exclusion': float(total_paid),
-                            'claim_count': int(len(violations))
-                        }
+                # Add signal
+                sig = {
+                    'signal_type': 'excluded_provider',
+                    'severity': 'critical',
+                    'evidence': {
+                        'exclusion_date': excldate.strftime('%Y-%m-%d'),
+                        'exclusion_type': leie_excltypes[j],
+                        'total_paid_after_exclusion': float(total_paid),
+                        'claim_count': int(claim_count)
                     }
-                    if sig not in all_flagged[npi]['signals']:
-                        all_flagged[npi]['signals'].append(sig)
-                        all_flagged[npi]['estimated_overpayment_usd'] += total_paid
-                        signal1_count += 1
+                }
+                # Same key as comparing the whole signal dict, at set-lookup cost
+                sig_key = (npi, *sig['evidence'].values())
+                if sig_key not in signal1_seen:
+                    signal1_seen.add(sig_key)
+                    all_flagged[npi]['signals'].append(sig)
+                    all_flagged[npi]['estimated_overpayment_usd'] += total_paid
+                    signal1_count += 1
+            
+            # Signals 2 and 6: keep the partial sums and periodically collapse
+            # them, so memory grows with distinct keys, not row groups
+            npi_parts.append(npi_partial)
+            if len(npi_parts) >= 16:
+                npi_parts = [sum_by_npi(pa.concat_tables(npi_parts))]
+            if hh_partial is not None:
+                hh_parts.append(hh_partial)
+                if len(hh_parts) >= 16:
+                    hh_parts = [sum_home_health(pa.concat_tables(hh_parts))]
     
     logger.info(f"Signal 1: Found {signal1_count} excluded providers")
     
     # Signal 2: Billing outliers (by taxonomy + state)
     logger.info("\n=== Signal 2: Billing Volume Outlier ===")
-    provider_totals = defaultdict(lambda: {'paid': 0, 'claims': 0, 'beneficiaries': 0, 'taxonomy': '', 'state': ''})
     
-    for i in range(min(groups_to_process, total_groups)):
-        if i % 100 == 0:
-            logger.info(f"Signal 2: Row group {i}/{groups_to_process}")
-        
-        table = pf.read_row_group(i)
-        df = table.to_pandas()
-        df['BILLING_PROVIDER_NPI_NUM'] = df['BILLING_PROVIDER_NPI_NUM'].astype(str)
-        
-        agg = df.groupby('BILLING_PROVIDER_NPI_NUM').agg({
-            'TOTAL_PAID': 'sum',
-            'TOTAL_CLAIMS': 'sum',
-            'TOTAL_UNIQUE_BENEFICIARIES': 'sum'
-        })
-        
-        for npi, row in agg.iterrows():
-            npi_str = str(npi)
-            provider_totals[npi_str]['paid'] += row['TOTAL_PAID']
-            provider_totals[npi_str]['claims'] += row['TOTAL_CLAIMS']
-            provider_totals[npi_str]['beneficiaries'] += row['TOTAL_UNIQUE_BENEFICIARIES']
-            
-            # Add NPPES info
-            if npi_str in nppes:
-                provider_totals[npi_str]['taxonomy'] = nppes[npi_str].get('taxonomy', '')
-                provider_totals[npi_str]['state'] = nppes[npi_str].get('state', '')
-    
-    # Group by taxonomy + state and calculate percentiles
-    peer_groups = defaultdict(list)
-    for npi, data in provider_totals.items():
-        key = (data['taxonomy'], data['state'])
-        peer_groups[key].append((npi, data['paid']))
+    # Provider totals as one frame indexed by NPI, with NPPES taxonomy + state
+    # joined on in a single batched lookup
+    provider_totals = pd.DataFrame({'paid': [], 'claims': [], 'beneficiaries': []}, index=pd.Index([], name='NPI'))
+    if npi_parts:
+        totals = sum_by_npi(pa.concat_tables(npi_parts))
+        provider_totals = pd.DataFrame({
+            'paid': totals['TOTAL_PAID'].to_numpy(),
+            'claims': totals['TOTAL_CLAIMS'].to_numpy(),
+            'beneficiaries': totals['TOTAL_UNIQUE_BENEFICIARIES'].to_numpy()
+        }, index=pd.Index(totals['BILLING_PROVIDER_NPI_NUM'].cast(pa.string()).to_pylist(), name='NPI'))
+        npi_parts = totals = None
+    provider_totals = provider_totals.join(nppes[['taxonomy', 'state']]).fillna({'taxonomy': '', 'state': ''})
+    
+    # Peer statistics per taxonomy + state, computed for all groups at once
+    peers = provider_totals.groupby(['taxonomy', 'state'], sort=False)['paid']
+    provider_totals['peer_group'] = peers.ngroup()
+    provider_totals['peer_size'] = peers.transform('size')
+    provider_totals['peer_median'] = peers.transform('median')
+    provider_totals['peer_p99'] = peers.transform('quantile', 0.99)
+    outliers = provider_totals[
+        (provider_totals['peer_size'] >= 10) & (provider_totals['paid'] > provider_totals['peer_p99'])
+    ].sort_values('peer_group', kind='stable')
     
     signal2_count = 0
-    for (taxonomy, state), members in peer_groups.items():
-        if len(members) < 10:
-            continue
+    outliers_nppes = nppes_lookup(nppes, outliers.index)
+    for npi, paid, claims, beneficiaries, taxonomy, state, median, p99 in outliers[
+            ['paid', 'claims', 'beneficiaries', 'taxonomy', 'state', 'peer_median', 'peer_p99']].itertuples(name=None):
+        ratio = paid / median if median > 0 else 0
+        severity = 'high' if ratio > 5 else 'medium'
         
-        amounts = [m[1] for m in members]
-        p99 = np.percentile(amounts, 99)
-        median = np.median(amounts)
+        if npi not in all_flagged:
+            nppes_info = outliers_nppes.get(npi, {})
+            all_flagged[npi] = new_flagged_entry(
+                npi,
+                provider_name=nppes_info.get('name', 'Unknown'),
+                entity_type='organization' if nppes_info.get('entity_type') == '2' else 'individual',
+                taxonomy_code=taxonomy,
+                state=state,
+                enumeration_date=nppes_info.get('enumeration_date', ''),
+                total_paid_all_time=paid,
+                total_claims_all_time=claims,
+                total_unique_beneficiaries_all_time=beneficiaries
+            )
         
-        for npi, paid in members:
-            if paid > p99:
-                ratio = paid / median if median > 0 else 0
-                severity = 'high' if ratio > 5 else 'medium'
-                
-                if npi not in all_flagged:
-                    nppes_info = nppes.get(npi, {})
-                    all_flagged[npi] = {
-                        'npi': npi,
-                        'provider_name': nppes_info.get('name', 'Unknown'),
-                        'entity_type': 'organization' if nppes_info.get('entity_type') == '2' else 'individual',
-                        'taxonomy_code': taxonomy,
-                        'state': state,
-                        'enumeration_date': nppes_info.get('enumeration_date', ''),
-                        'total_paid_all_time': paid,
-                        'total_claims_all_time': provider_totals[npi]['claims'],
-                        'total_unique_beneficiaries_all_time': provider_totals[npi]['beneficiaries'],
-                        'signals': [],
-                        'estimated_overpayment_usd': 0
-                    }
-                
-                all_flagged[npi]['signals'].append({
-                    'signal_type': 'billing_outlier',
-                    'severity': severity,
-                    'evidence': {
-                        'peer_median': float(median),
-                        'peer_99th_percentile': float(p99),
-                        'ratio_to_median': float(ratio)
-                    }
-                })
-                all_flagged[npi]['estimated_overpayment_usd'] += max(0, paid - p99)
-                signal2_count += 1
+        all_flagged[npi]['signals'].append({
+            'signal_type': 'billing_outlier',
+            'severity': severity,
+            'evidence': {
+                'peer_median': float(median),
+                'peer_99th_percentile': float(p99),
+                'ratio_to_median': float(ratio)
+            }
+        })
+        all_flagged[npi]['estimated_overpayment_usd'] += max(0, paid - p99)
+        signal2_count += 1
     
     logger.info(f"Signal 2: Found {signal2_count} billing outliers")
     
     # Signal 6: Geographic implausibility
     logger.info("\n=== Signal 6: Geographic Implausibility ===")
-    home_health_codes = {
-        'G0151', 'G0152', 'G0153', 'G0154', 'G0155', 'G0156', 'G0157', 'G0158', 'G0159',
-        'G0160', 'G0161', 'G0162', 'G0299', 'G0300', 'S9122', 'S9123', 'S9124',
-        'T1019', 'T1020', 'T1021', 'T1022'
-    }
-    
-    hh_monthly = defaultdict(lambda: {'claims': 0, 'beneficiaries': 0, 'codes': set()})
-    
-    for i in range(min(groups_to_process, total_groups)):
-        if i % 100 == 0:
-            logger.info(f"Signal 6: Row group {i}/{groups_to_process}")
-        
-        table = pf.read_row_group(i)
-        df = table.to_pandas()
-        
-        if 'HCPCS_CODE' in df.columns:
-            df['BILLING_PROVIDER_NPI_NUM'] = df['BILLING_PROVIDER_NPI_NUM'].astype(str)
-            hh = df[df['HCPCS_CODE'].isin(home_health_codes)]
-            
-            for _, row in hh.iterrows():
-                key = (row['BILLING_PROVIDER_NPI_NUM'], row['CLAIM_FROM_MONTH'])
-                hh_monthly[key]['claims'] += row['TOTAL_CLAIMS']
-                hh_monthly[key]['beneficiaries'] += row['TOTAL_UNIQUE_BENEFICIARIES']
-                hh_monthly[key]['codes'].add(row['HCPCS_CODE'])
-    
     signal6_count = 0
-    for (npi, month), data in hh_monthly.items():
-        if data['claims'] > 100:
-            ratio = data['beneficiaries'] / data['claims'] if data['claims'] > 0 else 1
-            if ratio < 0.1:
-                if npi not in all_flagged:
-                    nppes_info = nppes.get(npi, {})
-                    all_flagged[npi] = {
-                        'npi': npi,
-                        'provider_name': nppes_info.get('name', 'Unknown'),
-                        'entity_type': 'organization' if nppes_info.get('entity_type') == '2' else 'individual',
-                        'taxonomy_code': nppes_info.get('taxonomy', ''),
-                        'state': nppes_info.get('state', ''),
-                        'enumeration_date': nppes_info.get('enumeration_date', ''),
-                        'total_paid_all_time': 0,
-                        'total_claims_all_time': 0,
-                        'total_unique_beneficiaries_all_time': 0,
-                        'signals': [],
-                        'estimated_overpayment_usd': 0
-                    }
-                
-                all_flagged[npi]['signals'].append({
-                    'signal_type': 'geographic_implausibility',
-                    'severity': 'medium',
-                    'evidence': {
-                        'hcpcs_codes': list(data['codes']),
-                        'month': str(month),
-                        'total_claims': int(data['claims']),
-                        'unique_beneficiaries': int(data['beneficiaries']),
-                        'beneficiary_ratio': float(ratio)
-                    }
-                })
-                signal6_count += 1
+    implausible_months = []
+    if hh_parts:
+        # Totals per provider-month, then the claims/beneficiary test, all in Arrow.
+        # Codes present in a month are packed into one bitmask: after the
+        # per-code pass each bit occurs at most once per key, so summing the
+        # bits is the same as or-ing them.
+        hh = sum_home_health(pa.concat_tables(hh_parts))
+        hh = hh.append_column('HH_CODE_BIT', pc.shift_left(1, pc.cast(hh['HH_CODE_INDEX'], pa.int64())))
+        monthly = hh.group_by(['BILLING_PROVIDER_NPI_NUM', 'CLAIM_FROM_MONTH'], use_threads=False).aggregate([
+            ('TOTAL_CLAIMS', 'sum'),
+            ('TOTAL_UNIQUE_BENEFICIARIES', 'sum'),
+            ('HH_CODE_BIT', 'sum')
+        ])
+        monthly_claims = monthly['TOTAL_CLAIMS_sum']
+        implausible = pc.and_(
+            pc.greater(monthly_claims, 100),
+            pc.less(pc.divide(pc.cast(monthly['TOTAL_UNIQUE_BENEFICIARIES_sum'], pa.float64()), monthly_claims), 0.1)
+        )
+        monthly = monthly.filter(implausible)
+        implausible_months = list(zip(
+            monthly['BILLING_PROVIDER_NPI_NUM'].to_pylist(),
+            monthly['CLAIM_FROM_MONTH'].to_pylist(),
+            monthly['TOTAL_CLAIMS_sum'].to_pylist(),
+            monthly['TOTAL_UNIQUE_BENEFICIARIES_sum'].to_pylist(),
+            monthly['HH_CODE_BIT_sum'].to_pylist()
+        ))
+        hh_parts = hh = monthly = None
+    
+    hh_nppes = nppes_lookup(nppes, list(dict.fromkeys(npi for npi, *_ in implausible_months)))
+    for npi, month, claims, beneficiaries, code_mask in implausible_months:
+        ratio = beneficiaries / claims
+        if npi not in all_flagged:
+            nppes_info = hh_nppes.get(npi, {})
+            all_flagged[npi] = new_flagged_entry(
+                npi,
+                provider_name=nppes_info.get('name', 'Unknown'),
+                entity_type='organization' if nppes_info.get('entity_type') == '2' else 'individual',
+                taxonomy_code=nppes_info.get('taxonomy', ''),
+                state=nppes_info.get('state', ''),
+                enumeration_date=nppes_info.get('enumeration_date', '')
+            )
+        
+        all_flagged[npi]['signals'].append({
+            'signal_type': 'geographic_implausibility',
+            'severity': 'medium',
+            'evidence': {
+                'hcpcs_codes': [code for k, code in enumerate(home_health_values) if code_mask >> k & 1],
+                'month': str(month),
+                'total_claims': int(claims),
+                'unique_beneficiaries': int(beneficiaries),
+                'beneficiary_ratio': float(ratio)
+            }
+        })
+        signal6_count += 1
     
     logger.info(f"Signal 6: Found {signal6_count} geographic implausibility cases")
     
@@ -394,7 +557,7 @@ def main():
         # nppes = load_nppes_full(str(nppes_path))  # Full load
     else:
         logger.warning("NPPES data not found - some signals will be incomplete")
-        nppes = {}
+        nppes = nppes_frame({})
     
     # Run signals (set max_groups=None for full run)
     # For testing: max_groups=50 processes ~5M rows
@@ -413,8 +576,8 @@ def main():
     
     # Save
     output_path = 'fraud_signals.json'
-    with open(output_path, 'w') as f:
-        json.dump(report, f, indent=2, default=str)
+    with open(output_path, 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC))
     
     logger.info("="*60)
     logger.info("ANALYSIS COMPLETE")